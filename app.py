@@ -3,25 +3,45 @@
 複数教員から回収した穴埋め問題を統一フォーマットに整形する
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request
+import hashlib
+import json
+import orjson
 import re
+from functools import lru_cache
 
 app = Flask(__name__)
 
+# format_question の結果キャッシュ
+FORMAT_CACHE_SIZE = 2048
+# 問題文と正解の合計がこれより長い入力はキャッシュしない（メモリ使用量の上限）
+FORMAT_CACHE_MAX_INPUT_LEN = 64 * 1024
+
+# 整形ロジックの版（このファイルの内容から計算）
+# ETag に含めることで、整形ルールを変更して再デプロイすると同じ入力でも ETag が変わる
+with open(__file__, 'rb') as _f:
+    FORMATTER_VERSION = hashlib.blake2b(_f.read(), digest_size=8).hexdigest()
+
 # 空欄として認識するパターン（様々な形式に対応）
-BLANK_PATTERNS = [
-    r'（\s*）',                          # （　）全角括弧
-    r'\(\s*\)',                          # ( ) 半角括弧
-    r'【\s*】',                          # 【　】
-    r'\[\s*\]',                          # [ ]
-    r'_{2,}',                            # __ アンダースコア2つ以上
-    r'＿{2,}',                           # ＿＿ 全角アンダースコア2つ以上
-    r'[（(]\s*[ABab]\s*[）)]',           # (A) （B） (a) (b) など括弧付きアルファベット
-    r'（\s*[①②]\s*）',                  # （①）（②）丸数字
-    r'\(\s*[①②]\s*\)',                  # (①) (②) 丸数字半角括弧
-    r'（\s*[12]\s*）',                   # （1）（2）数字
-    r'\(\s*[12]\s*\)',                   # (1) (2) 数字半角括弧
-]
+# - （　）( )        空の括弧（全角・半角）
+# - 【　】[ ]        空の隅付き括弧・角括弧
+# - __ ＿＿          アンダースコア2つ以上（半角・全角）
+# - (A)（B）(a)(b)   括弧付きアルファベット（全角・半角の混在も可）
+# - （①）(②)         括弧付き丸数字（全角同士・半角同士）
+# - （1）(2)         括弧付き数字（全角同士・半角同士）
+# 置換先はすべて同じなので1つの選択パターンにまとめて1回で走査する
+# 括弧の種類ごとにまとめて各選択肢を固定文字で始めると、
+# 正規表現エンジンが候補の文字まで一気に読み飛ばせる
+_BLANKS_COMBINED = re.compile(
+    r'（\s*(?:[ABab]\s*[）)]|(?:[①②12]\s*)?）)'   # （　）（A）（A)（①）（1）
+    r'|\(\s*(?:[ABab]\s*[）)]|(?:[①②12]\s*)?\))'  # ( ) (A) (A）(①) (1)
+    r'|【\s*】'                                   # 【　】
+    r'|\[\s*\]'                                   # [ ]
+    r'|__+'                                       # __
+    r'|＿＿+'                                     # ＿＿
+)
+# 空欄はすべてこのいずれかの文字で始まる（含まなければ走査を省略）
+_BLANK_HINT = re.compile(r'[（(【\[_＿]')
 
 # ですます調→である調の変換パターン
 DESU_MASU_PATTERNS = [
@@ -39,25 +59,115 @@ DESU_MASU_PATTERNS = [
     (r'きます', 'くる'),
     (r'します', 'する'),
     (r'ですが', 'であるが'),
-    (r'ですので', 'であるので'),
+    # 「ですので」は「です」→「である」と同じ結果になるため置かない
+    # （置くと「ですのでしょうか」「ですのです」で末尾の「で」を先に消費し、
+    #   続く「でしょうか」「です」を変換し損ねる）
     (r'ですから', 'であるから'),
     (r'です', 'である'),
     (r'ます', 'る'),
 ]
+# 1つの選択パターンにまとめ、一致した文字列から置換先を引く
+# （選択は左から順に試されるため、長いパターンを先に並べる順序が効く）
+# パターンはすべて固定文字列なので、グループで囲まずに並べると
+# 正規表現エンジンが先頭文字の候補まで一気に読み飛ばせる
+_DESU_MASU_COMBINED = re.compile('|'.join(p for p, _ in DESU_MASU_PATTERNS))
+_DESU_MASU_REPLACEMENTS = dict(DESU_MASU_PATTERNS)
+# DESU_MASU_PATTERNS はすべて「ま」か「で」を含む（含まなければ走査を省略）
+_DESU_MASU_HINT = re.compile(r'[まで]')
 
 # 疑問文末尾の統一パターン（「なにか。」に統一）
-QUESTION_END_PATTERNS = [
-    (r'は何でしょうか[。？?]?', 'はなにか。'),
-    (r'は何ですか[。？?]?', 'はなにか。'),
-    (r'は何であろうか[。？?]?', 'はなにか。'),
-    (r'は何であるか[。？?]?', 'はなにか。'),
-    (r'は何か[。？?]?', 'はなにか。'),
-    (r'はなんでしょうか[。？?]?', 'はなにか。'),
-    (r'はなんですか[。？?]?', 'はなにか。'),
-    (r'はなんであろうか[。？?]?', 'はなにか。'),
-    (r'はなんであるか[。？?]?', 'はなにか。'),
-    (r'はなんか[。？?]?', 'はなにか。'),
-]
+# 「は何/はなん」+「でしょうか/ですか/であろうか/であるか/か」+ 句点・疑問符（省略可）
+QUESTION_END_PATTERN = r'は(?:何|なん)(?:でしょうか|ですか|であろうか|であるか|か)[。？?]?'
+QUESTION_END_REPLACEMENT = 'はなにか。'
+_QUESTION_END_RE = re.compile(QUESTION_END_PATTERN)
+
+# 日本語文字（ひらがな、カタカナ、漢字）
+_JP_CHAR = r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]'
+
+# 除外パターン（アルファベット+特定の漢字/カタカナ）
+# これらは固有名詞や専門用語として扱う
+_EXCLUDE_SUFFIXES = r'型|群|細胞|抗原|受容体|リンパ球|ウイルス|遺伝子|タンパク|蛋白|因子|鎖|座|領域|ドメイン|クラス|サブ|波|線|層|帯|管|点|面|軸|端|相|期|染色体'
+
+# 除外する前の文字パターン（「T細胞」「B細胞」のように前に特定文字がない場合）
+# T, Bなど単独で使われる専門用語のアルファベット
+_EXCLUDE_LETTERS_BEFORE_CELL = ('T', 'B', 'K', 'NK')
+_CELL_SUFFIXES = r'細胞|リンパ球|抗原|受容体'
+
+# 単独アルファベットの前後に来る文字:
+# - 前: 日本語、読点、接続詞（と、や、・）
+# - 後: 日本語、読点、接続詞
+_BEFORE_CHARS = r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF、,とや・]'
+_AFTER_CHARS = r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF、,とや・など]'
+_HAS_UPPER = re.compile(r'[A-Z]')
+# 「T細胞」「NK細胞」などで接尾辞の直前に来るアルファベット
+_CELL_LETTERS = ''.join(sorted({letter[-1] for letter in _EXCLUDE_LETTERS_BEFORE_CELL}))
+# 前後の文字は先読み・後読みで判定して消費しないため、
+# 「A、B、C」のように隣接する候補も1回の走査ですべて置換できる
+# 先頭を [A-Z] にしておくと、正規表現エンジンが大文字の位置まで一気に読み飛ばせる
+# 専門用語は否定先読みで除外する:
+# - 「T細胞」「B細胞」など（前の文字を問わない）
+# - 日本語 + アルファベット + 除外接尾辞（「A型」など）
+_STANDALONE = re.compile(
+    f'[A-Z](?<={_BEFORE_CHARS}[A-Z])'
+    f'(?!(?<=[{_CELL_LETTERS}])(?:{_CELL_SUFFIXES}))'
+    f'(?!(?<={_JP_CHAR}[A-Z])(?:{_EXCLUDE_SUFFIXES}))'
+    f'(?={_AFTER_CHARS})'
+)
+
+# clean_text 用
+# 全角空白・全角カンマ・全角ピリオドは先に半角空白・読点・句点へそろえる
+# （1文字ずつの置換なので正規表現を使わず str.replace で行う）
+_CLEAN_NORMALIZE = (
+    ('　', ' '),
+    ('，', '、'),
+    ('．', '。'),
+)
+# Markdown記法の除去（太字を先に全体から除去してから斜体を除去する。「***強調***」も外れる）
+_RE_BOLD = re.compile(r'\*\*(.+?)\*\*')
+_RE_ITALIC = re.compile(r'\*(.+?)\*')
+# 記法を除去した後の残りの全ルールを1つの選択パターンにまとめ、1回の走査で置換する
+# （記法を先に外すので、記法の前後で隣り合った空白・句読点もまとめて整理される）
+# 選択は左から順に試されるため、句点 → 読点 の順序が効く
+# 先頭の先読みで、どのルールも始まり得ない文字（大半の日本語）を1回の文字クラス判定で読み飛ばす
+# 句点・読点・空白は置換が必要な並び（連続、カンマとの組み合わせ）にだけ一致させ、
+# 単独の「。」「、」「 」ではコールバックを呼ばない
+# カンマ・読点の並びは先頭からだけ試す（否定後読み）。並びの途中から毎回試し直すと、
+# 句点・読点で終わらない長いカンマの並びで走査が文字数の2乗に比例してしまう
+_CLEAN_RE = re.compile(
+    r'(?=[,、。 \n])(?:'
+    r'(?P<kuten>(?:(?<![,、])[,、]+。|。(?=[,、]*。))(?:[,、]*。)*)'  # 読点/カンマ+句点、連続する句点
+    r'|(?P<period>,\.)'                 # カンマ+ピリオド
+    r'|(?P<touten>(?:(?<!,),+、|、(?=,*、))(?:,*、)*)'  # カンマ+読点、連続する読点
+    r'|(?P<space> {2,})'                # 連続する空白
+    r'|(?P<newline>\n\s*\n)'            # 連続する改行
+    r')'
+)
+_CLEAN_REPLACEMENTS = {
+    'kuten': '。',
+    'period': '.',
+    'touten': '、',
+    'space': ' ',
+    'newline': '\n',
+}
+
+# format_blanks 用
+_BLANK_MARKER = re.compile(r'\{\{BLANK\}\}')
+
+# format_answer 用
+_RE_SEIKAI_PREFIX = re.compile(r'^正解[：:]\s*')
+# 丸数字（①〜⑳）。位置がそのままラベル A〜T に対応する
+_CIRCLED = '①②③④⑤⑥⑦⑧⑨⑩⑪⑫⑬⑭⑮⑯⑰⑱⑲⑳'
+# 丸数字からアルファベットへの変換表
+_CIRCLED_TO_ALPHA = str.maketrans(_CIRCLED, 'ABCDEFGHIJKLMNOPQRST')
+# 数字からアルファベットへの変換マップ
+_NUM_TO_ALPHA = {str(i): chr(ord('A') + i - 1) for i in range(1, 27)}
+_RE_CIRCLED_LINE = re.compile(rf'^([{_CIRCLED}])[.\s:：\t]*(.+)$')
+_RE_NUM_LINE = re.compile(r'^([0-9]+)[.\s:：\t\)）]*(.+)$')
+_RE_ALPHA_LINE = re.compile(r'^([A-Za-z])[.\s:：\t]+(.+)$')
+_RE_CIRCLED_INLINE = re.compile(rf'([{_CIRCLED}])[.\s:：]*([^{_CIRCLED}]+?)(?=\s*[{_CIRCLED}]|$)')
+_RE_COMMA_SEPARATED = re.compile(r'([A-Za-z])[.．:：\t]\s*(.+?)(?=\s*[,、]\s*[A-Za-z][.．:：\t]|$)')
+# 括弧で囲まれた部分（中のラベル風の文字は無視する）またはラベル「A.」を1回の走査で拾う
+_RE_BRACKET_OR_LABEL = re.compile(r'(?P<bracket>\([^)]*\)|（[^）]*）)|(?P<label>[A-Za-z])[.．:：\t]\s*')
 
 def normalize_standalone_letters(text):
     """
@@ -72,71 +182,21 @@ def normalize_standalone_letters(text):
     - 英単語の一部（前後にアルファベットがある）
     - 「A型」「B細胞」など、アルファベット+漢字/カタカナの複合語
     """
-    # 日本語文字（ひらがな、カタカナ、漢字）
-    jp_char = r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]'
-    
-    result = text
-    
-    # 除外パターン（アルファベット+特定の漢字/カタカナ）
-    # これらは固有名詞や専門用語として扱う
-    exclude_suffixes = r'型|群|細胞|抗原|受容体|リンパ球|ウイルス|遺伝子|タンパク|蛋白|因子|鎖|座|領域|ドメイン|クラス|サブ|波|線|層|帯|管|点|面|軸|端|相|期|染色体'
-    
-    # 除外する前の文字パターン（「T細胞」「B細胞」のように前に特定文字がない場合）
-    # T, Bなど単独で使われる専門用語のアルファベット
-    exclude_letters_before_cell = {'T', 'B', 'K', 'NK'}
-    
-    # 「T細胞」「B細胞」などの専門用語を先に保護
-    for letter in exclude_letters_before_cell:
-        result = re.sub(f'{letter}(細胞|リンパ球|抗原|受容体)', f'__PROTECT_{letter}_\\1__', result)
-    
-    # パターン1: 日本語 + 大文字アルファベット1文字 + 除外接尾辞
-    # これらは変換しない（先に保護）
-    def protect_technical_terms(match):
-        return f'__TECH_{match.group(1)}_{match.group(2)}__'
-    
-    tech_pattern = f'({jp_char})([A-Z])({exclude_suffixes})'
-    result = re.sub(tech_pattern, lambda m: m.group(1) + f'__TECH_{m.group(2)}__' + m.group(3), result)
+    # 大文字アルファベットを含まない文はそのまま返す
+    if not _HAS_UPPER.search(text):
+        return text
     
-    # パターン2: 日本語/句読点/接続詞 + 大文字アルファベット1文字 + 日本語/句読点/接続詞
+    # 日本語/句読点/接続詞 + 大文字アルファベット1文字 + 日本語/句読点/接続詞
     # ただし、前後に他のアルファベットがある場合は除外（英単語の一部）
-    #
-    # 対象文字:
-    # - 前: 日本語、読点、接続詞（と、や、・）
-    # - 後: 日本語、読点、接続詞
-    before_chars = r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF、,とや・]'
-    after_chars = r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF、,とや・など]'
-    
-    def replace_standalone(match):
-        before = match.group(1)
-        letter = match.group(2)
-        after = match.group(3)
-        return before + '{{BLANK}}' + after
-    
-    # 繰り返し適用（A、B、Cのような連続パターンに対応）
-    prev_result = None
-    while prev_result != result:
-        prev_result = result
-        pattern = f'({before_chars})([A-Z])({after_chars})'
-        result = re.sub(pattern, replace_standalone, result)
-    
-    # 保護した専門用語を復元
-    result = re.sub(r'__TECH_([A-Z])__', r'\1', result)
-    for letter in exclude_letters_before_cell:
-        result = re.sub(f'__PROTECT_{letter}_(.+?)__', f'{letter}\\1', result)
-    
-    # 保護した専門用語を復元
-    for letter in exclude_letters_before_cell:
-        result = re.sub(f'__PROTECT_{letter}_(.+?)__', f'{letter}\\1', result)
-    
-    return result
+    return _STANDALONE.sub('{{BLANK}}', text)
 
 def normalize_blanks(text):
     """様々な形式の空欄を統一マーカーに変換"""
     result = text
     
-    # まず従来のパターンで変換
-    for pattern in BLANK_PATTERNS:
-        result = re.sub(pattern, '{{BLANK}}', result)
+    # まず従来のパターンで変換（括弧・アンダースコアがなければ省略）
+    if _BLANK_HINT.search(result):
+        result = _BLANKS_COMBINED.sub('{{BLANK}}', result)
     
     # 次に単独アルファベットを変換
     result = normalize_standalone_letters(result)
@@ -147,34 +207,32 @@ def convert_desu_masu(text):
     """ですます調をである調に変換し、疑問文末尾を統一"""
     result = text
     # まず疑問文末尾を統一（先に処理しないと「何ですか」→「何であるか」になってしまう）
-    for pattern, replacement in QUESTION_END_PATTERNS:
-        result = re.sub(pattern, replacement, result)
+    # QUESTION_END_PATTERN は「は」で始まる
+    if 'は' in result:
+        result = _QUESTION_END_RE.sub(QUESTION_END_REPLACEMENT, result)
     # ですます調→である調
-    for pattern, replacement in DESU_MASU_PATTERNS:
-        result = re.sub(pattern, replacement, result)
+    if _DESU_MASU_HINT.search(result):
+        result = _DESU_MASU_COMBINED.sub(lambda m: _DESU_MASU_REPLACEMENTS[m.group()], result)
     return result
 
+def _clean_sub(match):
+    """_CLEAN_RE の一致箇所を置換文字列に変換"""
+    return _CLEAN_REPLACEMENTS[match.lastgroup]
+
 def clean_text(text):
     """余計な空白や句読点を整理"""
-    # Markdown太字記法を除去 **text** → text
-    result = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
-    # Markdown斜体記法を除去 *text* → text
-    result = re.sub(r'\*(.+?)\*', r'\1', result)
-    # カンマ+句点の重複を除去
-    result = re.sub(r',。', '。', result)
-    result = re.sub(r'、。', '。', result)
-    result = re.sub(r',.', '.', result)
-    result = re.sub(r',、', '、', result)
-    # 連続する空白を1つに
-    result = re.sub(r'[ 　]+', ' ', result)
-    # 連続する句読点を1つに
-    result = re.sub(r'[、，]+', '、', result)
-    result = re.sub(r'[。．]+', '。', result)
+    result = text
+    # 全角の空白・句読点をそろえる
+    for fullwidth, normalized in _CLEAN_NORMALIZE:
+        result = result.replace(fullwidth, normalized)
+    # Markdown記法を除去 **text** → text、*text* → text
+    if '*' in result:
+        result = _RE_BOLD.sub(r'\1', result)
+        result = _RE_ITALIC.sub(r'\1', result)
+    # 句読点・空白・改行の整理を1回の走査で行う
+    result = _CLEAN_RE.sub(_clean_sub, result)
     # 文頭・文末の空白を除去
-    result = result.strip()
-    # 改行の整理
-    result = re.sub(r'\n\s*\n', '\n', result)
-    return result
+    return result.strip()
 
 def format_blanks(text, blank_count):
     """空欄マーカーを適切な形式に変換"""
@@ -185,12 +243,14 @@ def format_blanks(text, blank_count):
         return text.replace('{{BLANK}}', '（　　　　　）')
     else:
         # 空欄2つ以上の場合：A, B, C... のラベル付き
+        # 1回の走査で先頭から順にラベルを割り当てる（27個目以降はそのまま）
         labels = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-        result = text
-        for i in range(blank_count):
-            if i < len(labels):
-                result = result.replace('{{BLANK}}', f'（　　{labels[i]}　　）', 1)
-        return result
+        label_iter = iter(labels)
+        return _BLANK_MARKER.sub(
+            lambda m: f'（　　{next(label_iter)}　　）',
+            text,
+            count=min(blank_count, len(labels)),
+        )
 
 def format_answer(answer, blank_count):
     """正解を適切な形式に整形"""
@@ -202,28 +262,19 @@ def format_answer(answer, blank_count):
     elif blank_count == 1:
         # 空欄1つの場合
         # 既に「正解：」が含まれていれば除去
-        answer = re.sub(r'^正解[：:]\s*', '', answer)
+        answer = _RE_SEIKAI_PREFIX.sub('', answer, count=1)
         return f'正解：{answer}'
     else:
         # 空欄2つ以上の場合
         # 既存のフォーマットを解析して整形
-        answer = re.sub(r'^正解[：:]\s*', '', answer)
+        answer = _RE_SEIKAI_PREFIX.sub('', answer, count=1)
         
         labels = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-        # 丸数字からアルファベットへの変換マップ
-        circled_to_alpha = {
-            '①': 'A', '②': 'B', '③': 'C', '④': 'D', '⑤': 'E',
-            '⑥': 'F', '⑦': 'G', '⑧': 'H', '⑨': 'I', '⑩': 'J',
-            '⑪': 'K', '⑫': 'L', '⑬': 'M', '⑭': 'N', '⑮': 'O',
-            '⑯': 'P', '⑰': 'Q', '⑱': 'R', '⑲': 'S', '⑳': 'T',
-        }
-        # 数字からアルファベットへの変換マップ
-        num_to_alpha = {str(i): labels[i-1] for i in range(1, 27)}
         
         parts = []
         
-        # 改行で分割してみる
-        lines = answer.strip().split('\n')
+        # 改行で分割してみる（answer は先頭で strip 済み）
+        lines = answer.split('\n')
         
         if len(lines) >= 2:
             # 複数行の場合：各行を解析
@@ -232,24 +283,24 @@ def format_answer(answer, blank_count):
                 if not line:
                     continue
                 # 丸数字形式: ① 答え or ①. 答え
-                match_circled = re.match(r'^([①②③④⑤⑥⑦⑧⑨⑩⑪⑫⑬⑭⑮⑯⑰⑱⑲⑳])[.\s:：\t]*(.+)$', line)
+                match_circled = _RE_CIRCLED_LINE.match(line)
                 if match_circled:
-                    label = circled_to_alpha.get(match_circled.group(1), 'A')
+                    label = match_circled.group(1).translate(_CIRCLED_TO_ALPHA)
                     value = match_circled.group(2).strip()
                     parts.append(f'{label}. {value}')
                     continue
                 
                 # 数字形式: 1. 答え or 1) 答え
-                match_num = re.match(r'^([0-9]+)[.\s:：\t\)）]*(.+)$', line)
+                match_num = _RE_NUM_LINE.match(line)
                 if match_num:
                     num = match_num.group(1)
-                    label = num_to_alpha.get(num, labels[len(parts)] if len(parts) < len(labels) else 'A')
+                    label = _NUM_TO_ALPHA.get(num, labels[len(parts)] if len(parts) < len(labels) else 'A')
                     value = match_num.group(2).strip()
                     parts.append(f'{label}. {value}')
                     continue
                 
                 # A[TAB]答え or A. 答え or A: 答え or a. 答え 形式を解析
-                match = re.match(r'^([A-Za-z])[.\s:：\t]+(.+)$', line)
+                match = _RE_ALPHA_LINE.match(line)
                 if match:
                     label = match.group(1).upper()
                     value = match.group(2).strip()
@@ -262,55 +313,48 @@ def format_answer(answer, blank_count):
             # 1行の場合：様々な形式をチェック
             
             # まず丸数字形式を試す: ①xxx ②yyy or ① xxx ② yyy
-            pattern_circled = r'([①②③④⑤⑥⑦⑧⑨⑩⑪⑫⑬⑭⑮⑯⑰⑱⑲⑳])[.\s:：]*([^①②③④⑤⑥⑦⑧⑨⑩⑪⑫⑬⑭⑮⑯⑰⑱⑲⑳]+?)(?=\s*[①②③④⑤⑥⑦⑧⑨⑩⑪⑫⑬⑭⑮⑯⑰⑱⑲⑳]|$)'
-            matches_circled = re.findall(pattern_circled, answer)
+            matches_circled = _RE_CIRCLED_INLINE.findall(answer)
             
             if matches_circled:
                 for circled, value in matches_circled:
-                    label = circled_to_alpha.get(circled, 'A')
+                    label = circled.translate(_CIRCLED_TO_ALPHA)
                     parts.append(f'{label}. {value.strip().rstrip(",、")}')
             else:
                 # A. xxx, B. yyy のようなカンマ区切りを試す（括弧内は除く）
-                pattern = r'([A-Za-z])[.．:：\t]\s*(.+?)(?=\s*[,、]\s*[A-Za-z][.．:：\t]|$)'
-                matches = re.findall(pattern, answer)
+                matches = _RE_COMMA_SEPARATED.findall(answer)
                 
                 if matches:
                     for label, value in matches:
                         parts.append(f'{label.upper()}. {value.strip().rstrip(",、")}')
                 else:
-                    # A. xxx B. yyy 形式（スペース区切り、ただし括弧内は保護）
-                    # 括弧内を一時的に保護
-                    protected = answer
-                    bracket_contents = []
+                    # A. xxx B. yyy 形式（スペース区切り、ただし括弧内は値の一部として扱う）
+                    found = []
+                    value = []
+                    pos = 0
+                    for m in _RE_BRACKET_OR_LABEL.finditer(answer):
+                        if found:
+                            value.append(answer[pos:m.start()])
+                        if m.group('label'):
+                            value = []
+                            found.append((m.group('label').upper(), value))
+                        elif found:
+                            value.append(m.group('bracket'))
+                        pos = m.end()
+                    if found:
+                        value.append(answer[pos:])
                     
-                    def protect_brackets(m):
-                        bracket_contents.append(m.group(0))
-                        return f'__BRACKET_{len(bracket_contents)-1}__'
-                    
-                    protected = re.sub(r'\([^)]*\)', protect_brackets, protected)
-                    protected = re.sub(r'（[^）]*）', protect_brackets, protected)
-                    
-                    # A. xxx B. yyy 形式を解析
-                    pattern = r'([A-Za-z])[.．:：\t]\s*([^A-Za-z]+?)(?=\s*[A-Za-z][.．:：\t]|$)'
-                    matches = re.findall(pattern, protected)
-                    
-                    if matches:
-                        for label, value in matches:
-                            # 括弧を復元
-                            restored = value.strip()
-                            for i, content in enumerate(bracket_contents):
-                                restored = restored.replace(f'__BRACKET_{i}__', content)
-                            parts.append(f'{label.upper()}. {restored}')
-                    else:
-                        # パターンに一致しない場合、そのまま返す
-                        return f'正解：{answer}'
+                    for label, value in found:
+                        value = ''.join(value).strip()
+                        if value:
+                            parts.append(f'{label}. {value}')
+                    # 一致しない場合は parts が空のまま、下で入力をそのまま返す
         
         if parts:
             return '正解：' + '　　'.join(parts)
         else:
             return f'正解：{answer}'
 
-def format_question(question_text, answer_text):
+def _format_question(question_text, answer_text):
     """問題文と正解を整形"""
     # 1. 空欄を統一マーカーに変換
     normalized = normalize_blanks(question_text)
@@ -341,6 +385,21 @@ def format_question(question_text, answer_text):
         'blank_count': blank_count
     }
 
+_format_question_cached = lru_cache(maxsize=FORMAT_CACHE_SIZE)(_format_question)
+
+def format_question(question_text, answer_text):
+    """問題文と正解を整形（同じ入力の結果はキャッシュから返す）"""
+    if len(question_text) + len(answer_text) > FORMAT_CACHE_MAX_INPUT_LEN:
+        return _format_question(question_text, answer_text)
+    # キャッシュ内の dict を呼び出し側に書き換えられないようコピーして返す
+    return dict(_format_question_cached(question_text, answer_text))
+
+def _input_etag(question_text, answer_text):
+    """整形ロジックの版と入力（問題文と正解）から ETag を計算"""
+    # 孤立サロゲートを含む入力でも例外にならないよう surrogatepass でエンコードする
+    data = f'{FORMATTER_VERSION}\x00{question_text}\x00{answer_text}'.encode('utf-8', 'surrogatepass')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -351,8 +410,25 @@ def format_api():
     question = data.get('question', '')
     answer = data.get('answer', '')
     
+    # 前回と同じ入力が送られてきた場合は整形せずに 304 を返す
+    etag = _input_etag(question, answer)
+    if request.if_none_match.is_strong(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
     result = format_question(question, answer)
-    return jsonify(result)
+    # orjson は日本語を \uXXXX にエスケープせず UTF-8 のまま出力する
+    try:
+        body = orjson.dumps(result)
+    except orjson.JSONEncodeError:
+        # 孤立サロゲートなど UTF-8 にできない文字を含む場合は、
+        # 標準の json で \uXXXX にエスケープして返す（従来の jsonify と同じ出力）
+        body = json.dumps(result)
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
 if __name__ == '__main__':
+    # 開発用サーバー（本番は Dockerfile の gunicorn で起動する）
     app.run(host='0.0.0.0', port=5000, debug=False)